@@ -14,14 +14,47 @@ Core ideas:
 
 from __future__ import annotations
 
+import contextlib
 import math
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 
+try:
+    from torch.nn.attention import SDPBackend, sdpa_kernel
+except ImportError:  # torch < 2.3
+    SDPBackend = None
+    sdpa_kernel = None
+
+
+# Fused attention backends, most specialized first. PyTorch picks the first one
+# that supports the current device/dtype/shape; MATH always works.
+_SDPA_BACKENDS = (
+    [SDPBackend.FLASH_ATTENTION, SDPBackend.EFFICIENT_ATTENTION, SDPBackend.MATH] if SDPBackend is not None else []
+)
+
+
+def _sdpa_context():
+    if sdpa_kernel is None:
+        return contextlib.nullcontext()
+    return sdpa_kernel(_SDPA_BACKENDS)
+
+
+def _page_index(slot: torch.Tensor, *idx: int) -> Tuple[torch.Tensor, ...]:
+    """
+    Tensor indices selecting page (slot, *idx) of a KVPool buffer, one row per
+    batch entry, shaped [B, 1] to broadcast against positions [B, T].
+
+    Pool writes index with tensors only: an int index would first take a view,
+    and under torch.compile writing through a view of a graph input copies the
+    whole pool, while a plain index_put_ on the pool stays in place.
+    """
+    rows = slot.unsqueeze(1)
+    return (rows,) + tuple(torch.full_like(rows, i) for i in idx)
+
 
 @dataclass(frozen=True)
 class ModelConfig:
@@ -33,14 +66,72 @@ class ModelConfig:
     max_seq_len: int = 128
 
 
+@dataclass
+class KVPool:
+    """
+    Preallocated decoding state for up to max_sessions concurrent sessions.
+
+    With a KV cache, each generated token only runs the *new* position through
+    the model: its keys/values are written into the cache and its query attends
+    over everything cached so far, so a decode step no longer recomputes the
+    whole prefix.
+
+    All sessions share one pool, allocated once at startup with the session
+    ("slot") dimension outermost. A session only owns a slot index; growing its
+    sequence is a slice assignment into its page (no torch.cat copies) and
+    disconnecting just returns the slot to the freelist. Besides K/V we keep the
+    per-position signals the HUD visualizes, so the visualization window can be
+    read back from the pool instead of re-running the prefix:
+      kv[slot, layer]    -> [2, n_heads, max_seq_len, head_dim]  (keys, values)
+      q[slot, layer]     -> [n_heads, max_seq_len, head_dim]     (queries, for attention weights)
+      mlp[slot, layer]   -> [max_seq_len, d_ff]                  (post-GELU activations)
+      resid[slot, layer] -> [max_seq_len]                        (residual L2 norms, always fp32)
+    """
+
+    kv: torch.Tensor
+    q: torch.Tensor
+    mlp: torch.Tensor
+    resid: torch.Tensor
+    free_slots: List[int]
+
+    @classmethod
+    def allocate(
+        cls,
+        cfg: ModelConfig,
+        max_sessions: int,
+        device: torch.device | str = "cpu",
+        dtype: torch.dtype = torch.float32,
+    ) -> "KVPool":
+        n, L, H, S = max_sessions, cfg.n_layers, cfg.n_heads, cfg.max_seq_len
+        head_dim = cfg.d_model // cfg.n_heads
+        return cls(
+            kv=torch.zeros(n, L, 2, H, S, head_dim, device=device, dtype=dtype),
+            q=torch.zeros(n, L, H, S, head_dim, device=device, dtype=dtype),
+            mlp=torch.zeros(n, L, S, cfg.d_ff, device=device, dtype=dtype),
+            resid=torch.zeros(n, L, S, device=device, dtype=torch.float32),
+            free_slots=list(range(max_sessions - 1, -1, -1)),
+        )
+
+    def acquire(self) -> Optional[int]:
+        """Claim a free slot, or None if every slot is in use."""
+        return self.free_slots.pop() if self.free_slots else None
+
+    def release(self, slot: int) -> None:
+        self.free_slots.append(slot)
+
+
 class CausalSelfAttention(nn.Module):
     """
-    Multi-head causal self-attention implemented from scratch so we can expose
-    attention weights [n_heads, T, T] for visualization.
+    Multi-head causal self-attention.
 
     For each token position i, attention produces a weighted mixture over all
     previous positions j <= i. The causal mask enforces "no peeking" at future
     tokens, which is what makes this decoder-only (GPT-style) model autoregressive.
+
+    By default this uses the fused F.scaled_dot_product_attention kernel, which
+    never materializes the [T, T] score matrix. When the attention weights are
+    needed for visualization (return_attn=True) it falls back to the explicit
+    from-scratch computation so the weights [n_heads, T, T] can be exposed.
     """
 
     def __init__(self, cfg: ModelConfig):
@@ -54,40 +145,88 @@ class CausalSelfAttention(nn.Module):
         self.qkv = nn.Linear(cfg.d_model, 3 * cfg.d_model, bias=False)
         self.proj = nn.Linear(cfg.d_model, cfg.d_model, bias=False)
 
-        # True above the diagonal => mask out "future" tokens.
-        causal_mask = torch.triu(torch.ones(cfg.max_seq_len, cfg.max_seq_len, dtype=torch.bool), diagonal=1)
-        self.register_buffer("causal_mask", causal_mask, persistent=False)
-
-    def forward(self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        # Additive causal mask: -inf above the diagonal ("future" tokens), 0 elsewhere.
+        # Adding it to the scores needs no fresh [B, H, T, T] allocation the way
+        # masked_fill does, and being a float buffer it follows model.to(dtype).
+        future = torch.triu(torch.ones(cfg.max_seq_len, cfg.max_seq_len, dtype=torch.bool), diagonal=1)
+        additive_mask = torch.zeros(cfg.max_seq_len, cfg.max_seq_len)
+        additive_mask.masked_fill_(future, float("-inf"))
+        self.register_buffer("additive_mask", additive_mask, persistent=False)
+
+    def forward(
+        self,
+        x: torch.Tensor,
+        return_attn: bool = False,
+        kv_pool: Optional[KVPool] = None,
+        slot: Optional[torch.Tensor] = None,
+        layer: int = 0,
+        positions: Optional[torch.Tensor] = None,
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
         """
         x: [B, T, d_model]
         returns:
           - y: [B, T, d_model]
-          - attn_weights: [B, n_heads, T, T] (after softmax)
+          - attn_weights: [B, n_heads, T, T] (after softmax), or None unless return_attn
+
+        With kv_pool, x holds the tokens at `positions` [B, T] of the pool pages
+        `slot` [B]. Their K/V (and Q) are written into page (slot, layer) and the
+        queries attend over that whole page, with keys after each query's
+        position masked out.
         """
         bsz, t, d_model = x.shape
 
-        qkv = self.qkv(x)  # [B, T, 3*d_model]
-        q, k, v = qkv.chunk(3, dim=-1)
-
-        # Split heads:
-        #   [B, T, d_model] -> [B, n_heads, T, head_dim]
-        q = q.view(bsz, t, self.n_heads, self.head_dim).transpose(1, 2)
-        k = k.view(bsz, t, self.n_heads, self.head_dim).transpose(1, 2)
-        v = v.view(bsz, t, self.n_heads, self.head_dim).transpose(1, 2)
-
-        # Scaled dot-product attention: scores [B, n_heads, T, T]
-        scores = (q @ k.transpose(-2, -1)) / math.sqrt(self.head_dim)
-        scores = scores.masked_fill(self.causal_mask[:t, :t], float("-inf"))
-
-        attn = torch.softmax(scores, dim=-1)
-        y = attn @ v  # [B, n_heads, T, head_dim]
+        # Project and split heads in one view:
+        #   [B, T, 3*d_model] -> [3, B, n_heads, T, head_dim]
+        qkv = self.qkv(x).view(bsz, t, 3, self.n_heads, self.head_dim).permute(2, 0, 3, 1, 4)
+        q, k, v = qkv[0], qkv[1], qkv[2]  # views, no copies
+
+        if kv_pool is not None:
+            rows, layer_idx, k_idx, v_idx = _page_index(slot, layer, 0, 1)
+            kv_pool.kv[rows, layer_idx, k_idx, :, positions] = k.transpose(1, 2)
+            kv_pool.kv[rows, layer_idx, v_idx, :, positions] = v.transpose(1, 2)
+            kv_pool.q[rows, layer_idx, :, positions] = q.transpose(1, 2)
+
+            # Attending over the full max_seq_len page (instead of slicing up to
+            # the current length) keeps every shape static, which is what lets
+            # torch.compile reuse one graph for the whole generation.
+            k = kv_pool.kv[slot, layer, 0]  # [B, n_heads, max_seq_len, head_dim]
+            v = kv_pool.kv[slot, layer, 1]
+            attn_mask = self.additive_mask[positions].unsqueeze(1)  # [B, 1, T, max_seq_len]
+            with _sdpa_context():
+                y = F.scaled_dot_product_attention(q, k, v, attn_mask=attn_mask)
+            attn = None
+        elif return_attn:
+            # Scaled dot-product attention: scores [B, n_heads, T, T]
+            scores = (q @ k.transpose(-2, -1)) / math.sqrt(self.head_dim)
+            scores = scores + self.additive_mask[:t, :t].to(scores.dtype)
+
+            attn = torch.softmax(scores, dim=-1)
+            y = attn @ v  # [B, n_heads, T, head_dim]
+        else:
+            # Same math, fused: the causal mask is applied inside the kernel
+            # (is_causal=True), so the [B, n_heads, T, T] scores never exist.
+            with _sdpa_context():
+                y = F.scaled_dot_product_attention(q, k, v, is_causal=True)
+            attn = None
 
         # Merge heads: [B, n_heads, T, head_dim] -> [B, T, d_model]
-        y = y.transpose(1, 2).contiguous().view(bsz, t, d_model)
+        y = y.transpose(1, 2).reshape(bsz, t, d_model)
         y = self.proj(y)
         return y, attn
 
+    def cached_attention(self, kv_pool: KVPool, slot: int, layer: int, t: int, rows: int) -> torch.Tensor:
+        """
+        Recompute attention weights for the last `rows` positions of a cached
+        context of length t, from the cached queries and keys.
+
+        returns: [n_heads, rows, t] (after softmax)
+        """
+        q = kv_pool.q[slot, layer, :, t - rows : t]  # [n_heads, rows, head_dim]
+        k = kv_pool.kv[slot, layer, 0, :, :t]  # [n_heads, t, head_dim]
+        scores = (q @ k.transpose(-2, -1)) / math.sqrt(self.head_dim)
+        scores = scores + self.additive_mask[t - rows : t, :t].to(scores.dtype)
+        return torch.softmax(scores, dim=-1, dtype=torch.float32)
+
 
 class MLP(nn.Module):
     """
@@ -126,14 +265,24 @@ class TransformerBlock(nn.Module):
         self.ln2 = nn.LayerNorm(cfg.d_model)
         self.mlp = MLP(cfg)
 
-    def forward(self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
-        attn_out, attn_w = self.attn(self.ln1(x))
+    def forward(
+        self,
+        x: torch.Tensor,
+        return_attn: bool = False,
+        kv_pool: Optional[KVPool] = None,
+        slot: Optional[torch.Tensor] = None,
+        layer: int = 0,
+        positions: Optional[torch.Tensor] = None,
+    ) -> Tuple[torch.Tensor, Optional[torch.Tensor], torch.Tensor, torch.Tensor]:
+        attn_out, attn_w = self.attn(
+            self.ln1(x), return_attn=return_attn, kv_pool=kv_pool, slot=slot, layer=layer, positions=positions
+        )
         x = x + attn_out
 
         mlp_out, mlp_act = self.mlp(self.ln2(x))
         x = x + mlp_out
 
-        resid_norm = x.norm(dim=-1)  # [B, T]
+        resid_norm = x.float().norm(dim=-1)  # [B, T]
         return x, attn_w, mlp_act, resid_norm
 
 
@@ -142,7 +291,7 @@ class TinyGPT(nn.Module):
     Minimal GPT-like language model.
 
     Forward returns both logits and a cache of internal activations:
-      cache["attn"][layer]  -> [n_heads, T, T]
+      cache["attn"][layer]  -> [n_heads, T, T]  (None unless requested, see forward)
       cache["mlp"][layer]   -> [T, d_ff]  (post-GELU activations)
       cache["resid"][layer] -> [T]        (residual L2 norms)
     """
@@ -161,35 +310,95 @@ class TinyGPT(nn.Module):
         # Weight tying is common in GPT-like models.
         self.lm_head.weight = self.tok_emb.weight
 
+        # Position ids 0..max_seq_len-1, sliced per call instead of a fresh arange.
+        self.register_buffer("positions_full", torch.arange(cfg.max_seq_len).unsqueeze(0), persistent=False)
+
     @torch.no_grad()
-    def forward(self, input_ids: torch.Tensor) -> Tuple[torch.Tensor, Dict[str, List[torch.Tensor]]]:
+    def forward(
+        self,
+        input_ids: torch.Tensor,
+        return_attn: bool = False,
+        viz_layer: Optional[int] = None,
+        kv_pool: Optional[KVPool] = None,
+        slot: Optional[torch.Tensor] = None,
+        cache_pos: Optional[torch.Tensor] = None,
+    ) -> Tuple[torch.Tensor, Optional[Dict[str, List[Optional[torch.Tensor]]]]]:
+        """
+        Attention weights are only materialized when return_attn=True, and then
+        only for viz_layer (or for every layer if viz_layer is None). All other
+        layers run the fused attention kernel and report None in cache["attn"].
+
+        Incremental decoding with KVPool pages, one row per session: row b of
+        input_ids runs on page slot[b], where cache_pos[b] is the position of
+        input_ids[b, 0] (slot and cache_pos are [B]):
+          - prefill: cache_pos=0, input_ids is the whole context
+          - decode:  cache_pos=n, input_ids is the single token at position n
+        Decode steps of different sessions can share one batched call.
+        The prefill may be right-padded up to max_seq_len so its shape is fixed;
+        padded positions are masked from later queries and get overwritten as
+        decoding reaches them. The caller keeps cache_pos + T <= max_seq_len.
+
+        In this mode every layer's signals are recorded in the pool and the
+        returned cache is None: read them back with kv_pool.mlp / kv_pool.resid
+        and attention_window().
+        """
         if input_ids.dim() != 2:
             raise ValueError(f"input_ids must be [B, T], got {tuple(input_ids.shape)}")
-        if input_ids.size(0) != 1:
-            raise ValueError("This educational HUD demo expects batch size 1.")
+        if input_ids.size(0) != 1 and kv_pool is None:
+            raise ValueError("This educational HUD demo expects batch size 1 (batch through a KVPool).")
 
         _, t = input_ids.shape
-        if t > self.cfg.max_seq_len:
-            input_ids = input_ids[:, -self.cfg.max_seq_len :]
-            t = self.cfg.max_seq_len
+        if kv_pool is not None:
+            positions = cache_pos.unsqueeze(1) + self.positions_full[:, :t]  # [B, T]
+        else:
+            if t > self.cfg.max_seq_len:
+                input_ids = input_ids[:, -self.cfg.max_seq_len :]
+                t = self.cfg.max_seq_len
+            positions = self.positions_full[:, :t]  # [1, T]
 
-        positions = torch.arange(t, device=input_ids.device).unsqueeze(0)  # [1, T]
-        x = self.tok_emb(input_ids) + self.pos_emb(positions)  # [1, T, d_model]
+        x = self.tok_emb(input_ids) + self.pos_emb(positions)  # [B, T, d_model]
 
-        attn_cache: List[torch.Tensor] = []
+        attn_cache: List[Optional[torch.Tensor]] = []
         mlp_cache: List[torch.Tensor] = []
         resid_cache: List[torch.Tensor] = []
 
-        for block in self.blocks:
-            x, attn_w, mlp_act, resid_norm = block(x)
-            attn_cache.append(attn_w[0].detach())  # [n_heads, T, T]
+        for layer, block in enumerate(self.blocks):
+            want_attn = return_attn and kv_pool is None and (viz_layer is None or layer == viz_layer)
+            x, attn_w, mlp_act, resid_norm = block(
+                x, return_attn=want_attn, kv_pool=kv_pool, slot=slot, layer=layer, positions=positions
+            )
+            if kv_pool is not None:
+                rows, layer_idx = _page_index(slot, layer)
+                kv_pool.mlp[rows, layer_idx, positions] = mlp_act
+                kv_pool.resid[rows, layer_idx, positions] = resid_norm
+                continue
+            attn_cache.append(attn_w[0].detach() if attn_w is not None else None)  # [n_heads, T, T]
             mlp_cache.append(mlp_act[0].detach())  # [T, d_ff]
             resid_cache.append(resid_norm[0].detach())  # [T]
 
         x = self.ln_f(x)
-        logits = self.lm_head(x)  # [1, T, vocab]
+        logits = self.lm_head(x)  # [B, T, vocab]
 
+        if kv_pool is not None:
+            return logits, None
         cache = {"attn": attn_cache, "mlp": mlp_cache, "resid": resid_cache}
         return logits, cache
 
+    def to_inference_dtype(self, dtype: torch.dtype) -> "TinyGPT":
+        """
+        Cast the weights to `dtype` (e.g. bfloat16) for serving, keeping the
+        LayerNorms in fp32 for stable normalization statistics.
+        """
+        self.to(dtype=dtype)
+        for module in self.modules():
+            if isinstance(module, nn.LayerNorm):
+                module.float()
+        return self
 
+    @torch.no_grad()
+    def attention_window(self, kv_pool: KVPool, slot: int, layer: int, t: int, rows: int) -> torch.Tensor:
+        """
+        Attention weights [n_heads, rows, t] of the last `rows` positions of a
+        cached context of length t (see CausalSelfAttention.cached_attention).
+        """
+        return self.blocks[layer].attn.cached_attention(kv_pool, slot, layer, t, rows)
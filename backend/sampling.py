@@ -7,7 +7,7 @@ Sampling turns these logits into a probability distribution and draws ONE token.
 
 from __future__ import annotations
 
-from typing import List, Tuple
+from typing import Tuple
 
 import torch
 
@@ -24,43 +24,33 @@ def apply_temperature(logits: torch.Tensor, temperature: float) -> torch.Tensor:
     return logits / _safe_temperature(temperature)
 
 
-def top_k_filter(logits: torch.Tensor, top_k: int) -> torch.Tensor:
+def top_k_top_p_filter_sorted(logits: torch.Tensor, top_k: int, top_p: float) -> Tuple[torch.Tensor, torch.Tensor]:
     """
-    Keep only the top_k tokens by logit value.
-    """
-    k = int(top_k)
-    if k <= 0 or k >= logits.numel():
-        return logits
-    values, _ = torch.topk(logits, k)
-    threshold = values[-1]
-    return torch.where(logits >= threshold, logits, torch.tensor(float("-inf"), device=logits.device))
+    Top-k then top-p filtering, done entirely in descending sorted order.
 
+    Top-k keeps a prefix; top-p keeps the prefix whose cumulative probability
+    (of the top-k renormalized distribution) stays <= p, always including the
+    first token. Filtered entries are set to -inf. Nothing is scattered back to
+    vocab order: sample over the sorted logits and map the sampled position
+    through sorted_idx.
 
-def top_p_filter(logits: torch.Tensor, top_p: float) -> torch.Tensor:
-    """
-    Nucleus (top-p) filtering:
-    Keep the smallest set of tokens whose cumulative probability >= p.
+    Returns: (sorted_filtered_logits, sorted_idx), both [vocab]
     """
-    p = float(top_p)
-    if p >= 1.0:
-        return logits
-    p = max(p, 0.0)
-
     sorted_logits, sorted_idx = torch.sort(logits, descending=True)
-    sorted_probs = torch.softmax(sorted_logits, dim=-1)
-    cumprobs = torch.cumsum(sorted_probs, dim=-1)
 
-    # Mask tokens that push cumulative prob over p.
-    sorted_mask = cumprobs > p
-    # Always keep at least one token.
-    sorted_mask[..., 0] = False
+    k = int(top_k)
+    if 0 < k < sorted_logits.numel():
+        sorted_logits[k:] = float("-inf")
 
-    filtered_sorted_logits = torch.where(
-        sorted_mask, torch.tensor(float("-inf"), device=logits.device), sorted_logits
-    )
-    out = torch.full_like(logits, float("-inf"))
-    out.scatter_(0, sorted_idx, filtered_sorted_logits)
-    return out
+    p = float(top_p)
+    if p < 1.0:
+        cumprobs = torch.cumsum(torch.softmax(sorted_logits, dim=-1), dim=-1)
+        # Mask tokens that push cumulative prob over p, always keeping the first.
+        sorted_mask = cumprobs > max(p, 0.0)
+        sorted_mask[0] = False
+        sorted_logits = sorted_logits.masked_fill(sorted_mask, float("-inf"))
+
+    return sorted_logits, sorted_idx
 
 
 def sample_next_token(
@@ -69,30 +59,28 @@ def sample_next_token(
     top_k: int = 0,
     top_p: float = 1.0,
     generator: torch.Generator | None = None,
-) -> Tuple[int, float, torch.Tensor]:
-    """
-    Returns: (token_id, token_probability, probs_distribution)
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor, torch.Tensor]:
     """
-    if logits.dim() != 1:
-        raise ValueError(f"logits must be 1D [vocab], got shape {tuple(logits.shape)}")
-
-    filtered = apply_temperature(logits, temperature)
-    filtered = top_k_filter(filtered, top_k)
-    filtered = top_p_filter(filtered, top_p)
+    Temperature, top-k, top-p, normalization and sampling in one pass.
 
-    probs = torch.softmax(filtered, dim=-1)
-    token_id = int(torch.multinomial(probs, 1, generator=generator).item())
-    token_prob = float(probs[token_id].item())
-    return token_id, token_prob, probs
+    The vocab is sorted once by top_k_top_p_filter_sorted; the softmax and the
+    draw happen over that sorted order and the sampled position is mapped back
+    to a token id, so there is no scatter back to vocab order.
 
-
-def topk_probs(probs: torch.Tensor, k: int = 12) -> List[Tuple[int, float]]:
-    """
-    Return top-k (token_id, prob) pairs sorted by probability descending.
+    Returns: (token_id, token_probability, sorted_probs, sorted_ids)
+      - token_id, token_probability: 0-d tensors (no host sync here)
+      - sorted_probs: final distribution [vocab], descending
+      - sorted_ids: token id of each entry of sorted_probs
     """
-    kk = int(k)
-    kk = max(1, min(kk, probs.numel()))
-    values, indices = torch.topk(probs, kk)
-    return [(int(i.item()), float(v.item())) for v, i in zip(values, indices)]
-
+    if logits.dim() != 1:
+        raise ValueError(f"logits must be 1D [vocab], got shape {tuple(logits.shape)}")
 
+    sorted_logits, sorted_ids = top_k_top_p_filter_sorted(
+        apply_temperature(logits, temperature), top_k=top_k, top_p=top_p
+    )
+    probs = torch.softmax(sorted_logits, dim=-1)
+    # Exponential race (Gumbel-max in probability space): argmax(p_i / E_i)
+    # with E_i ~ Exp(1) is a draw from probs, as one pointwise op and an argmax.
+    race = torch.empty_like(probs).exponential_(generator=generator)
+    pos = torch.argmax(probs / race)
+    return sorted_ids[pos], probs[pos], probs, sorted_ids
@@ -8,6 +8,12 @@ real internal signals of a Transformer during generation:
   - residual stream L2 norms (activation "energy")
 
 One request -> one generated token -> one response (real-time HUD updates).
+
+A response is two WebSocket messages: a JSON text frame with "kind": "viz"
+carrying tokens, sampling and meta, then a binary frame with the visualization
+arrays as little-endian float16. The header gives each array's "shape" and its
+element "offset" into the binary frame. Errors are a single {"error": ...}
+text frame.
 """
 
 from __future__ import annotations
@@ -15,15 +21,15 @@ from __future__ import annotations
 import asyncio
 import json
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, Dict, List, Tuple
 
 import torch
 import websockets
 
-from model import ModelConfig, TinyGPT
-from sampling import sample_next_token, topk_probs
-from tokenizer import BOS, EOS, ByteTokenizer
+from model import KVPool, ModelConfig, TinyGPT
+from sampling import sample_next_token
+from tokenizer import BOS, EOS, PAD, ByteTokenizer
 
 
 HOST = "localhost"
@@ -32,6 +38,10 @@ PORT = 8765
 VIZ_WINDOW = 32
 TOPK_TO_SEND = 12
 FLOAT_DECIMALS = 4
+# Concurrent clients served; each one owns a preallocated KV pool slot.
+MAX_SESSIONS = 8
+# At most this many sessions' decode steps share one forward.
+MAX_BATCH = MAX_SESSIONS
 
 
 def _resolve_device() -> torch.device:
@@ -60,6 +70,83 @@ def _resolve_device() -> torch.device:
     raise RuntimeError(f"Unknown SLM_DEVICE={forced!r}. Use auto|cpu|cuda.")
 
 
+def _resolve_dtype(device: torch.device) -> torch.dtype:
+    """
+    Weight dtype for serving.
+
+    Default: bfloat16 on GPUs that support it natively (Ampere+), where halving
+    the weight and KV cache bytes pays off because decoding is memory-bandwidth
+    bound. float32 on CPU: this model's weights fit in cache, and the bf16
+    conversions measured slower than fp32 there.
+    Override via env var:
+      - SLM_DTYPE=auto (default)
+      - SLM_DTYPE=fp32
+      - SLM_DTYPE=bf16
+    """
+    forced = os.environ.get("SLM_DTYPE", "auto").strip().lower()
+    if forced in ("fp32", "float32"):
+        return torch.float32
+    if forced in ("bf16", "bfloat16"):
+        return torch.bfloat16
+    if forced not in ("", "auto"):
+        raise RuntimeError(f"Unknown SLM_DTYPE={forced!r}. Use auto|fp32|bf16.")
+
+    # Compute capability 8.x (Ampere) is the first with native bf16; is_bf16_supported()
+    # also reports True for older GPUs that only emulate it.
+    if device.type == "cuda" and torch.cuda.get_device_capability(device)[0] >= 8:
+        return torch.bfloat16
+    return torch.float32
+
+
+def _batch_bucket(n: int) -> int:
+    """Decode batches are padded up to a power of two, so only a few shapes exist."""
+    return min(MAX_BATCH, 1 << (n - 1).bit_length())
+
+
+def _compile_model(
+    model: TinyGPT, kv_pool: KVPool, staging: "InputStaging", pad_slot: int, cfg: ModelConfig, device: torch.device
+) -> TinyGPT:
+    """
+    Wrap the model with torch.compile for the serving path.
+
+    Every call the server makes has a fixed shape (a prefill padded to
+    max_seq_len, or a decode batch of _batch_bucket rows), so each compiles
+    exactly once. All of them are warmed up here, on the padding slot and
+    through the same input staging buffers the server uses (so strides match),
+    so compilation happens at startup instead of on the first client request.
+    On GPU the "reduce-overhead" mode (CUDA graphs) is requested; on CPU the
+    default Inductor mode is used. The graph writes the KV pool in place, and
+    Inductor skips CUDA graphs for mutated inputs unless they have static
+    addresses, so the pool tensors and the staging buffer are marked as such.
+
+    Disable via env var SLM_COMPILE=0. Falls back to eager if compilation fails
+    (e.g. older torch, or no C++ compiler for the CPU backend).
+    """
+    if os.environ.get("SLM_COMPILE", "1").strip().lower() in ("0", "false", "no", "off"):
+        return model
+    if not hasattr(torch, "compile"):
+        print("[backend] torch.compile unavailable; running eager")
+        return model
+
+    mode = "reduce-overhead" if device.type == "cuda" else "default"
+    mark_static = getattr(torch._dynamo, "mark_static_address", None)
+    if mark_static is not None:
+        for buf in (kv_pool.kv, kv_pool.q, kv_pool.mlp, kv_pool.resid, staging.dev):
+            mark_static(buf)
+    try:
+        compiled = torch.compile(model, mode=mode, fullgraph=True, dynamic=False)
+        input_ids, slot_t, cache_pos_t = staging.stage([[]], [pad_slot], [0], pad_to=cfg.max_seq_len)
+        compiled(input_ids, kv_pool=kv_pool, slot=slot_t, cache_pos=cache_pos_t)
+        for b in sorted({_batch_bucket(n) for n in range(1, MAX_BATCH + 1)}):
+            input_ids, slot_t, cache_pos_t = staging.stage([[PAD]] * b, [pad_slot] * b, [1] * b)
+            compiled(input_ids, kv_pool=kv_pool, slot=slot_t, cache_pos=cache_pos_t)
+    except Exception as e:
+        print(f"[backend] torch.compile failed, running eager: {e}")
+        return model
+    print(f"[backend] torch.compile ready (mode={mode})")
+    return compiled
+
+
 def _clamp_int(value: Any, lo: int, hi: int, default: int) -> int:
     try:
         v = int(value)
@@ -78,16 +165,54 @@ def _clamp_float(value: Any, lo: float, hi: float, default: float) -> float:
     return max(lo, min(hi, v))
 
 
-def _tensor_to_list(t: torch.Tensor, decimals: int = FLOAT_DECIMALS) -> Any:
+def _fetch_to_host(
+    *,
+    sampled_id: torch.Tensor,
+    sampled_prob: torch.Tensor,
+    probs: torch.Tensor,
+    prob_ids: torch.Tensor,
+    attn_win: torch.Tensor,
+    mlp_win: torch.Tensor,
+    resid_win: torch.Tensor,
+    resid_last: torch.Tensor,
+    decimals: int = FLOAT_DECIMALS,
+) -> Dict[str, Any]:
     """
-    Convert a tensor to JSON-friendly nested lists, rounding floats to reduce payload size.
+    Copy everything one response needs off the device in a single transfer.
+
+    Every .item()/.tolist() on a CUDA tensor is a blocking device->host sync.
+    Instead of pulling values one by one, everything is packed into one flat
+    buffer, copied with a single .cpu(), and split apart on the host.
+
+    The visualization windows (attention [w, w], MLP [w, d_ff], residual [w])
+    are converted to float16 on the device and come back as the raw bytes of
+    the binary viz frame, so they never become Python lists. The few scalars
+    stay float32, bit-cast into the same buffer.
     """
-    tt = t.detach()
-    if tt.is_floating_point():
-        tt = tt.float()
-        scale = float(10**decimals)
-        tt = torch.round(tt * scale) / scale
-    return tt.cpu().tolist()
+    k = min(TOPK_TO_SEND, probs.numel())
+
+    viz = torch.cat([attn_win.reshape(-1), mlp_win.reshape(-1), resid_win.reshape(-1)]).to(torch.float16)
+    floats = torch.cat(
+        [
+            sampled_id.reshape(1).float(),
+            sampled_prob.reshape(1).float(),
+            prob_ids[:k].float(),
+            probs[:k].float(),
+            resid_last.reshape(-1).float(),
+        ]
+    )
+
+    host = torch.cat([floats.view(torch.int16), viz.view(torch.int16)]).cpu()
+    floats_h = host[: 2 * floats.numel()].view(torch.float32)
+    head, top_ids, top_probs, last_h = torch.split(floats_h, [2, k, k, resid_last.numel()])
+    head = head.tolist()
+    return {
+        "sampled_id": int(head[0]),
+        "sampled_prob": head[1],
+        "topk": [(int(tid), p) for tid, p in zip(top_ids.tolist(), top_probs.tolist())],
+        "resid_last": [round(x, decimals) for x in last_h.tolist()],
+        "viz": host[2 * floats.numel() :].numpy().astype("<i2", copy=False).tobytes(),
+    }
 
 
 def _build_error(message: str) -> str:
@@ -96,8 +221,94 @@ def _build_error(message: str) -> str:
 
 @dataclass
 class SessionState:
-    token_ids: List[int]
+    slot: int
+    token_ids: List[int] = field(default_factory=list)
+    # Kept in step with token_ids so each step only converts the new token.
+    token_pieces: List[str] = field(default_factory=list)
+    generated: bytearray = field(default_factory=bytearray)
     t: int = 0
+    # Number of leading positions of the active context already in the KV pool slot.
+    cache_len: int = 0
+
+    def reset(self, token_ids: List[int], tokenizer: ByteTokenizer) -> None:
+        self.token_ids = token_ids
+        self.token_pieces = [tokenizer.id_to_piece(tid) for tid in token_ids]
+        self.generated = bytearray(tokenizer.ids_to_generated_bytes(token_ids))
+        self.t = 0
+        self.cache_len = 0
+
+    def append(self, token_id: int, tokenizer: ByteTokenizer) -> None:
+        self.token_ids.append(token_id)
+        self.token_pieces.append(tokenizer.id_to_piece(token_id))
+        if 0 <= token_id <= 255:
+            self.generated.append(token_id)
+
+
+@dataclass
+class InputStaging:
+    """
+    Reusable buffers for the per-step model inputs, one row per batched
+    session: [token ids..., slot, cache_pos].
+
+    Building input_ids with torch.tensor(..., device=cuda) is a blocking copy of
+    a fresh pageable tensor every step. Instead the ids are written into one
+    pinned host buffer and sent with a single non_blocking copy, which queues
+    behind the previous step's work instead of stalling the host. The host
+    buffer is safe to rewrite each step: the step's .cpu() fetch has already
+    waited for the copy. On CPU the two buffers are the same tensor.
+    """
+
+    host: torch.Tensor  # [max_batch, max_seq_len + 2]
+    dev: torch.Tensor  # [max_batch, max_seq_len + 2]
+
+    @classmethod
+    def allocate(cls, cfg: ModelConfig, device: torch.device, max_batch: int = MAX_BATCH) -> "InputStaging":
+        shape = (max_batch, cfg.max_seq_len + 2)
+        host = torch.zeros(shape, dtype=torch.long, pin_memory=device.type == "cuda")
+        dev = host if device.type == "cpu" else torch.zeros(shape, dtype=torch.long, device=device)
+        return cls(host=host, dev=dev)
+
+    def stage(
+        self,
+        rows: List[List[int]],
+        slots: List[int],
+        cache_pos: List[int],
+        pad_to: int = 0,
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        """
+        Returns (input_ids [B, T], slot [B], cache_pos [B]) on the device, for
+        B = len(rows), with every row right-padded with PAD up to
+        T = max(pad_to, longest row).
+        """
+        b = len(rows)
+        width = max(pad_to, max(len(ids) for ids in rows))
+        for i, ids in enumerate(rows):
+            n = len(ids)
+            self.host[i, :n] = torch.as_tensor(ids, dtype=torch.long)
+            self.host[i, n:width] = PAD
+        self.host[:b, -2] = torch.tensor(slots, dtype=torch.long)
+        self.host[:b, -1] = torch.tensor(cache_pos, dtype=torch.long)
+        if self.dev is not self.host:
+            self.dev[:b].copy_(self.host[:b], non_blocking=True)
+        return self.dev[:b, :width], self.dev[:b, -2], self.dev[:b, -1]
+
+
+@dataclass
+class StepControls:
+    temperature: float
+    top_k: int
+    top_p: float
+    viz_layer: int
+    viz_head: int
+
+
+@dataclass
+class DecodeRequest:
+    """One session's decode step, waiting for the next batched forward."""
+
+    session: SessionState
+    controls: StepControls
+    future: "asyncio.Future[Dict[str, Any]]"
 
 
 def _extract_prompt(req: Dict[str, Any]) -> str:
@@ -119,56 +330,43 @@ def _prepare_response(
     device: torch.device,
     viz_layer: int,
     viz_head: int,
-    logits_t: int,
-    cache: Dict[str, List[torch.Tensor]],
-    sampled_id: int,
-    sampled_prob: float,
-    probs: torch.Tensor,
+    w: int,
+    host: Dict[str, Any],
 ) -> Dict[str, Any]:
-    w = _select_window(logits_t)
-
-    # Attention: [n_heads, T, T] -> one head window [w, w]
-    attn_all = cache["attn"][viz_layer]
-    attn_win = attn_all[viz_head, -w:, -w:]
-
-    # MLP: [T, d_ff] -> window [w, d_ff]
-    mlp_win = cache["mlp"][viz_layer][-w:, :]
-
-    # Residual norms: [T] -> window [w]
-    resid_win = cache["resid"][viz_layer][-w:]
+    sampled_id = host["sampled_id"]
+    topk_json = [{"id": tid, "token": tokenizer.id_to_piece(tid), "prob": p} for tid, p in host["topk"]]
 
-    resid_layers_last = [float(cache["resid"][l][-1].item()) for l in range(cfg.n_layers)]
+    generated = session.generated.decode("utf-8", errors="replace")
 
-    topk = topk_probs(probs, k=TOPK_TO_SEND)
-    topk_json = [{"id": tid, "token": tokenizer.id_to_piece(tid), "prob": float(p)} for tid, p in topk]
-
-    token_pieces = [tokenizer.id_to_piece(tid) for tid in session.token_ids]
-    generated = tokenizer.decode(session.token_ids)
-
-    done = int(sampled_id) == EOS
+    done = sampled_id == EOS
 
     resp: Dict[str, Any] = {
+        "kind": "viz",
+        "dtype": "f16",
         "token_ids": session.token_ids,
-        "tokens": token_pieces,
+        "tokens": session.token_pieces,
         "generated": generated,
-        "sampled": {"id": int(sampled_id), "token": tokenizer.id_to_piece(int(sampled_id)), "prob": float(sampled_prob)},
+        "sampled": {"id": sampled_id, "token": session.token_pieces[-1], "prob": host["sampled_prob"]},
         "topk": topk_json,
         "attention": {
             "layer": viz_layer,
             "head": viz_head,
-            "matrix": _tensor_to_list(attn_win),
+            "shape": [w, w],
+            "offset": 0,
         },
         "mlp": {
             "layer": viz_layer,
-            "activations": _tensor_to_list(mlp_win),
+            "shape": [w, cfg.d_ff],
+            "offset": w * w,
             "window_start": max(0, len(session.token_ids) - w),
         },
         "residual": {
             "layer": viz_layer,
-            "norms": _tensor_to_list(resid_win),
+            "shape": [w],
+            "offset": w * w + w * cfg.d_ff,
             "window_start": max(0, len(session.token_ids) - w),
         },
-        "residual_layers_last": [round(x, FLOAT_DECIMALS) for x in resid_layers_last],
+        "residual_layers_last": host["resid_last"],
         "meta": {
             "device": str(device),
             "t": session.t,
@@ -188,8 +386,20 @@ async def main() -> None:
     device = _resolve_device()
     tokenizer = ByteTokenizer()
     cfg = ModelConfig()
+    dtype = _resolve_dtype(device)
     model = TinyGPT(cfg).to(device)
+    if dtype != torch.float32:
+        model.to_inference_dtype(dtype)
     model.eval()
+    # One extra page absorbs the padding rows of decode batches.
+    kv_pool = KVPool.allocate(cfg, max_sessions=MAX_SESSIONS + 1, device=device, dtype=dtype)
+    pad_slot = kv_pool.acquire()
+    # Shared by all sessions: each step runs from staging to fetch without yielding.
+    staging = InputStaging.allocate(cfg, device)
+    # One sampling generator for the server's lifetime, randomly seeded.
+    rng = torch.Generator(device=device)
+    rng.seed()
+    decode_queue: "asyncio.Queue[DecodeRequest]" = asyncio.Queue()
 
     cuda_available = torch.cuda.is_available()
     cuda_built = torch.backends.cuda.is_built()
@@ -199,11 +409,81 @@ async def main() -> None:
     print(f"[backend] torch={torch.__version__} cuda_built={cuda_built} cuda_available={cuda_available} torch_cuda={torch_cuda}")
     if gpu_name:
         print(f"[backend] gpu0={gpu_name}")
-    print(f"[backend] device={device}  model=d_model={cfg.d_model} layers={cfg.n_layers} heads={cfg.n_heads} d_ff={cfg.d_ff}")
+    print(f"[backend] device={device} dtype={dtype}  model=d_model={cfg.d_model} layers={cfg.n_layers} heads={cfg.n_heads} d_ff={cfg.d_ff}")
+    model = _compile_model(model, kv_pool, staging, pad_slot, cfg, device)
     print(f"[backend] serving ws://{HOST}:{PORT}")
 
+    def sample_and_fetch(session: SessionState, controls: StepControls, last_logits: torch.Tensor) -> Dict[str, Any]:
+        """Sample the next token and fetch the HUD windows, once session.cache_len covers the context."""
+        t_active = session.cache_len
+        next_id, next_prob, probs, prob_ids = sample_next_token(
+            last_logits,
+            temperature=controls.temperature,
+            top_k=controls.top_k,
+            top_p=controls.top_p,
+            generator=rng,
+        )
+
+        # Visualization windows over the last w positions, read back from the pool.
+        w = _select_window(t_active)
+        layer = controls.viz_layer
+        attn = model.attention_window(kv_pool, session.slot, layer, t_active, rows=w)
+        return _fetch_to_host(
+            sampled_id=next_id,
+            sampled_prob=next_prob,
+            probs=probs,
+            prob_ids=prob_ids,
+            attn_win=attn[controls.viz_head, :, -w:],  # [w, w]
+            mlp_win=kv_pool.mlp[session.slot, layer, t_active - w : t_active],  # [w, d_ff]
+            resid_win=kv_pool.resid[session.slot, layer, t_active - w : t_active],  # [w]
+            resid_last=kv_pool.resid[session.slot, :, t_active - 1],  # [n_layers]
+        )
+
+    def decode_batch(batch: List[DecodeRequest]) -> None:
+        # Pad to a fixed batch size with rows that write into the padding slot.
+        n_pad = _batch_bucket(len(batch)) - len(batch)
+        input_ids, slot_t, cache_pos_t = staging.stage(
+            [req.session.token_ids[-1:] for req in batch] + [[PAD]] * n_pad,
+            [req.session.slot for req in batch] + [pad_slot] * n_pad,
+            [req.session.cache_len for req in batch] + [0] * n_pad,
+        )
+        logits, _ = model(input_ids, kv_pool=kv_pool, slot=slot_t, cache_pos=cache_pos_t)
+        for row, req in enumerate(batch):
+            req.session.cache_len += 1
+            try:
+                req.future.set_result(sample_and_fetch(req.session, req.controls, logits[row, 0].float()))
+            except Exception as e:
+                req.future.set_exception(e)
+
+    async def decoder() -> None:
+        """
+        Continuous batching: every decode step queued while the previous batch
+        ran goes into the next forward together, up to MAX_BATCH sessions.
+        """
+        while True:
+            batch = [await decode_queue.get()]
+            # Give handlers with a request already in hand the chance to queue it.
+            await asyncio.sleep(0)
+            while len(batch) < MAX_BATCH and not decode_queue.empty():
+                batch.append(decode_queue.get_nowait())
+            # A cancelled handler may already have released its slot.
+            batch = [req for req in batch if not req.future.cancelled()]
+            if not batch:
+                continue
+            try:
+                decode_batch(batch)
+            except Exception as e:
+                for req in batch:
+                    if not req.future.done():
+                        req.future.set_exception(e)
+
     async def handler(conn: websockets.ServerConnection) -> None:
-        session = SessionState(token_ids=[])
+        slot = kv_pool.acquire()
+        if slot is None:
+            print("[backend] client rejected (no free session slot)")
+            await conn.send(_build_error(f"Server busy: all {MAX_SESSIONS} session slots are in use."))
+            return
+        session = SessionState(slot=slot)
         print("[backend] client connected")
         try:
             async for raw in conn:
@@ -224,17 +504,18 @@ async def main() -> None:
                     await conn.send(_build_error("Only step=true is supported."))
                     continue
 
-                temperature = _clamp_float(req.get("temperature", 1.0), 0.05, 5.0, 1.0)
-                top_k = _clamp_int(req.get("top_k", 0), 0, 200, 0)
-                top_p = _clamp_float(req.get("top_p", 1.0), 0.0, 1.0, 1.0)
-                viz_layer = _clamp_int(req.get("viz_layer", 0), 0, cfg.n_layers - 1, 0)
-                viz_head = _clamp_int(req.get("viz_head", 0), 0, cfg.n_heads - 1, 0)
+                controls = StepControls(
+                    temperature=_clamp_float(req.get("temperature", 1.0), 0.05, 5.0, 1.0),
+                    top_k=_clamp_int(req.get("top_k", 0), 0, 200, 0),
+                    top_p=_clamp_float(req.get("top_p", 1.0), 0.0, 1.0, 1.0),
+                    viz_layer=_clamp_int(req.get("viz_layer", 0), 0, cfg.n_layers - 1, 0),
+                    viz_head=_clamp_int(req.get("viz_head", 0), 0, cfg.n_heads - 1, 0),
+                )
 
                 # Reset context if a non-empty prompt is provided.
                 prompt = _extract_prompt(req)
                 if prompt != "":
-                    session.token_ids = [BOS] + tokenizer.encode(prompt)
-                    session.t = 0
+                    session.reset([BOS, *tokenizer.encode(prompt)], tokenizer)
 
                 if not session.token_ids:
                     await conn.send(_build_error("Empty session. Send a non-empty prompt first."))
@@ -243,15 +524,26 @@ async def main() -> None:
                 try:
                     # The model has a fixed context window (max_seq_len). Feeding only the
                     # last tokens keeps generation responsive even if the session grows.
-                    active_ids = session.token_ids[-cfg.max_seq_len :]
-                    input_ids = torch.tensor([active_ids], dtype=torch.long, device=device)
-                    logits, cache = model(input_ids)  # logits: [1, T, vocab]
-                    last_logits = logits[0, -1]
-
-                    next_id, next_prob, probs = sample_next_token(
-                        last_logits, temperature=temperature, top_k=top_k, top_p=top_p
-                    )
-                    session.token_ids.append(int(next_id))
+                    n_ids = len(session.token_ids)
+                    t_active = min(n_ids, cfg.max_seq_len)
+                    if session.cache_len == t_active - 1 and n_ids <= cfg.max_seq_len:
+                        # Only the newest token is missing from the cache: decode it in
+                        # the next batch, together with other sessions' decode steps.
+                        future = asyncio.get_running_loop().create_future()
+                        decode_queue.put_nowait(DecodeRequest(session=session, controls=controls, future=future))
+                        host = await future
+                    else:
+                        # New prompt, or the window slid past max_seq_len (which shifts
+                        # every position): prefill the whole active context. Right-padding
+                        # to max_seq_len keeps the input shape fixed for torch.compile.
+                        input_ids, slot_t, cache_pos_t = staging.stage(
+                            [session.token_ids[-cfg.max_seq_len :]], [session.slot], [0], pad_to=cfg.max_seq_len
+                        )
+                        logits, _ = model(input_ids, kv_pool=kv_pool, slot=slot_t, cache_pos=cache_pos_t)
+                        session.cache_len = t_active
+                        host = sample_and_fetch(session, controls, logits[0, t_active - 1].float())
+                    w = _select_window(t_active)
+                    session.append(host["sampled_id"], tokenizer)
                     session.t += 1
 
                     resp = _prepare_response(
@@ -259,24 +551,24 @@ async def main() -> None:
                         tokenizer=tokenizer,
                         cfg=cfg,
                         device=device,
-                        viz_layer=viz_layer,
-                        viz_head=viz_head,
-                        logits_t=int(logits.shape[1]),
-                        cache=cache,
-                        sampled_id=int(next_id),
-                        sampled_prob=float(next_prob),
-                        probs=probs,
+                        viz_layer=controls.viz_layer,
+                        viz_head=controls.viz_head,
+                        w=w,
+                        host=host,
                     )
                     await conn.send(json.dumps(resp, ensure_ascii=False))
+                    await conn.send(host["viz"])
                 except Exception as e:
                     await conn.send(_build_error(f"Server error: {e}"))
         except websockets.exceptions.ConnectionClosed:
             pass
         finally:
+            kv_pool.release(session.slot)
             print("[backend] client disconnected")
 
+    decoder_task = asyncio.create_task(decoder())
     async with websockets.serve(handler, HOST, PORT, max_size=2 * 1024 * 1024):
-        await asyncio.Future()  # run forever
+        await decoder_task  # run forever
 
 
 if __name__ == "__main__":
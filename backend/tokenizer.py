@@ -17,7 +17,7 @@ Why bytes?
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Iterable, List
+from typing import Dict, Iterable
 
 
 BYTE_VOCAB_SIZE = 256
@@ -27,6 +27,25 @@ PAD = 258
 VOCAB_SIZE = 259
 
 
+def _byte_piece(token_id: int) -> str:
+    # Common whitespace escapes are easier to see in the HUD.
+    if token_id == 10:
+        return "\\n"
+    if token_id == 9:
+        return "\\t"
+    if token_id == 13:
+        return "\\r"
+    if token_id == 32:
+        return " "
+
+    # Printable ASCII gets displayed as-is.
+    if 33 <= token_id <= 126:
+        return chr(token_id)
+
+    # Everything else uses a hex escape.
+    return f"\\x{token_id:02x}"
+
+
 @dataclass(frozen=True)
 class ByteTokenizer:
     bos_id: int = BOS
@@ -34,48 +53,29 @@ class ByteTokenizer:
     pad_id: int = PAD
     vocab_size: int = VOCAB_SIZE
 
-    def encode(self, text: str) -> List[int]:
-        data = text.encode("utf-8", errors="strict")
-        return list(data)
+    def __post_init__(self) -> None:
+        # HUD display string for every known id, built once per tokenizer.
+        pieces: Dict[int, str] = {token_id: _byte_piece(token_id) for token_id in range(BYTE_VOCAB_SIZE)}
+        # Assigned in reverse so BOS wins if the special ids ever coincide.
+        pieces[self.pad_id] = "<PAD>"
+        pieces[self.eos_id] = "<EOS>"
+        pieces[self.bos_id] = "<BOS>"
+        object.__setattr__(self, "_pieces", pieces)
+
+    def encode(self, text: str) -> bytes:
+        # bytes is already a sequence of ids in [0, 255].
+        return text.encode("utf-8", errors="strict")
 
     def decode(self, ids: Iterable[int]) -> str:
         data = self.ids_to_generated_bytes(ids)
         return data.decode("utf-8", errors="replace")
 
     def ids_to_generated_bytes(self, ids: Iterable[int]) -> bytes:
-        out = bytearray()
-        for token_id in ids:
-            if 0 <= int(token_id) <= 255:
-                out.append(int(token_id))
-        return bytes(out)
+        return bytes(token_id for token_id in map(int, ids) if 0 <= token_id <= 255)
 
     def id_to_piece(self, token_id: int) -> str:
         token_id = int(token_id)
-        if token_id == self.bos_id:
-            return "<BOS>"
-        if token_id == self.eos_id:
-            return "<EOS>"
-        if token_id == self.pad_id:
-            return "<PAD>"
-
-        if not (0 <= token_id <= 255):
+        piece = self._pieces.get(token_id)
+        if piece is None:
             return f"<UNK:{token_id}>"
-
-        # Common whitespace escapes are easier to see in the HUD.
-        if token_id == 10:
-            return "\\n"
-        if token_id == 9:
-            return "\\t"
-        if token_id == 13:
-            return "\\r"
-        if token_id == 32:
-            return " "
-
-        # Printable ASCII gets displayed as-is.
-        if 33 <= token_id <= 126:
-            return chr(token_id)
-
-        # Everything else uses a hex escape.
-        return f"\\x{token_id:02x}"
-
-
+        return piece
@@ -1,20 +1,25 @@
 #include "websocketclient.h"
 
 #include <QDateTime>
+#include <QFloat16>
 #include <QJsonArray>
 #include <QJsonDocument>
 #include <QJsonObject>
 #include <QJsonParseError>
 #include <QJsonValue>
 #include <QUrl>
+#include <QVector>
 #include <QtMath>
 
+#include <cstring>
+
 static QString wsUrl() { return QStringLiteral("ws://localhost:8765"); }
 
 WebSocketClient::WebSocketClient(QObject *parent) : QObject(parent) {
   connect(&m_ws, &QWebSocket::connected, this, &WebSocketClient::onConnected);
   connect(&m_ws, &QWebSocket::disconnected, this, &WebSocketClient::onDisconnected);
   connect(&m_ws, &QWebSocket::textMessageReceived, this, &WebSocketClient::onTextMessageReceived);
+  connect(&m_ws, &QWebSocket::binaryMessageReceived, this, &WebSocketClient::onBinaryMessageReceived);
   connect(&m_ws, &QWebSocket::errorOccurred, this, &WebSocketClient::onErrorOccurred);
 
   m_reconnectTimer.setSingleShot(true);
@@ -51,6 +56,7 @@ void WebSocketClient::onDisconnected() {
     m_busy = false;
     emit busyChanged();
   }
+  m_hasPendingHeader = false;
 
   // Exponential backoff up to 5 seconds.
   const int baseMs = 250;
@@ -123,19 +129,40 @@ QVariant WebSocketClient::jsonToVariant(const QJsonValue &v) {
   return QVariant();
 }
 
-void WebSocketClient::onTextMessageReceived(const QString &message) {
-  // Store raw payload for visibility/debugging, but cap size to avoid memory spikes.
-  QString clipped = message;
-  if (clipped.size() > MAX_JSON_CHARS) {
-    clipped = clipped.left(MAX_JSON_CHARS);
-    clipped.append(QStringLiteral("\n...(truncated)..."));
+QVariantList WebSocketClient::decodeF16(const QByteArray &viz, const QJsonObject &section) {
+  // section: {"shape": [rows] or [rows, cols], "offset": elements into viz}.
+  const auto shape = section.value("shape").toArray();
+  const qsizetype offset = section.value("offset").toInteger();
+  const qsizetype rows = shape.isEmpty() ? 0 : shape.at(0).toInteger();
+  const qsizetype cols = (shape.size() > 1) ? shape.at(1).toInteger() : 1;
+  const qsizetype n = rows * cols;
+  if (n <= 0 || offset < 0 || (offset + n) * qsizetype(sizeof(qfloat16)) > viz.size())
+    return QVariantList();
+
+  // Copy out first: the frame data has no alignment guarantee.
+  QVector<qfloat16> half(n);
+  std::memcpy(half.data(), viz.constData() + offset * sizeof(qfloat16), n * sizeof(qfloat16));
+  QVector<float> values(n);
+  qFloatFromFloat16(values.data(), half.constData(), n);
+
+  QVariantList out;
+  out.reserve(rows);
+  if (shape.size() == 1) {
+    for (float v : values)
+      out.append(double(v));
+    return out;
   }
-  if (m_lastJson != clipped) {
-    m_lastJson = clipped;
-    emit lastJsonChanged();
+  for (qsizetype r = 0; r < rows; r++) {
+    QVariantList row;
+    row.reserve(cols);
+    for (qsizetype c = 0; c < cols; c++)
+      row.append(double(values[r * cols + c]));
+    out.append(QVariant(row));
   }
+  return out;
+}
 
-  const int payloadBytes = message.toUtf8().size();
+void WebSocketClient::finishRoundTrip(int payloadBytes) {
   bool perfDirty = false;
   if (m_lastPayloadBytes != payloadBytes) {
     m_lastPayloadBytes = payloadBytes;
@@ -159,10 +186,26 @@ void WebSocketClient::onTextMessageReceived(const QString &message) {
     m_busy = false;
     emit busyChanged();
   }
+}
+
+void WebSocketClient::onTextMessageReceived(const QString &message) {
+  // Store raw payload for visibility/debugging, but cap size to avoid memory spikes.
+  QString clipped = message;
+  if (clipped.size() > MAX_JSON_CHARS) {
+    clipped = clipped.left(MAX_JSON_CHARS);
+    clipped.append(QStringLiteral("\n...(truncated)..."));
+  }
+  if (m_lastJson != clipped) {
+    m_lastJson = clipped;
+    emit lastJsonChanged();
+  }
+
+  const int payloadBytes = message.toUtf8().size();
 
   QJsonParseError parseError;
   const auto doc = QJsonDocument::fromJson(message.toUtf8(), &parseError);
   if (parseError.error != QJsonParseError::NoError || !doc.isObject()) {
+    finishRoundTrip(payloadBytes);
     setLastError(QStringLiteral("JSON parse error: %1").arg(parseError.errorString()));
     appendLog(QStringLiteral("RECV INVALID JSON (%1 bytes): %2").arg(payloadBytes).arg(parseError.errorString()));
     return;
@@ -170,11 +213,36 @@ void WebSocketClient::onTextMessageReceived(const QString &message) {
 
   const auto root = doc.object();
   if (root.contains("error")) {
+    m_hasPendingHeader = false;
+    finishRoundTrip(payloadBytes);
     setLastError(root.value("error").toString());
     appendLog(QStringLiteral("BACKEND ERROR: %1").arg(m_lastError));
     return;
   }
 
+  // The visualization arrays follow in a binary frame; apply both together.
+  if (root.value("kind").toString() == QStringLiteral("viz")) {
+    m_pendingHeader = root;
+    m_pendingHeaderBytes = payloadBytes;
+    m_hasPendingHeader = true;
+    return;
+  }
+
+  finishRoundTrip(payloadBytes);
+  applyResponse(root, QByteArray());
+}
+
+void WebSocketClient::onBinaryMessageReceived(const QByteArray &message) {
+  if (!m_hasPendingHeader) {
+    appendLog(QStringLiteral("RECV unexpected binary frame (%1 bytes)").arg(message.size()));
+    return;
+  }
+  m_hasPendingHeader = false;
+  finishRoundTrip(m_pendingHeaderBytes + message.size());
+  applyResponse(m_pendingHeader, message);
+}
+
+void WebSocketClient::applyResponse(const QJsonObject &root, const QByteArray &viz) {
   setLastError(QString());
 
   // tokens
@@ -225,6 +293,8 @@ void WebSocketClient::onTextMessageReceived(const QString &message) {
     m_attentionHead = a.value("head").toInt(m_attentionHead);
     if (a.contains("matrix")) {
       m_attentionMatrix = jsonToVariant(a.value("matrix")).toList();
+    } else if (a.contains("shape")) {
+      m_attentionMatrix = decodeF16(viz, a);
     }
     emit attentionChanged();
   }
@@ -235,6 +305,8 @@ void WebSocketClient::onTextMessageReceived(const QString &message) {
     m_mlpLayer = m.value("layer").toInt(m_mlpLayer);
     if (m.contains("activations")) {
       m_mlpActivations = jsonToVariant(m.value("activations")).toList();
+    } else if (m.contains("shape")) {
+      m_mlpActivations = decodeF16(viz, m);
     }
     emit mlpChanged();
   }
@@ -245,6 +317,8 @@ void WebSocketClient::onTextMessageReceived(const QString &message) {
     m_residualLayer = r.value("layer").toInt(m_residualLayer);
     if (r.contains("norms")) {
       m_residualNorms = jsonToVariant(r.value("norms")).toList();
+    } else if (r.contains("shape")) {
+      m_residualNorms = decodeF16(viz, r);
     }
     emit residualChanged();
   }
@@ -266,7 +340,7 @@ void WebSocketClient::onTextMessageReceived(const QString &message) {
   }
 
   appendLog(QStringLiteral("RECV %1 bytes  rtt=%2ms  done=%3")
-                .arg(payloadBytes)
+                .arg(m_lastPayloadBytes)
                 .arg(QString::number(m_lastRoundTripMs, 'f', 0))
                 .arg(m_done ? QStringLiteral("true") : QStringLiteral("false")));
 }
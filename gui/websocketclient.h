@@ -1,7 +1,10 @@
 #pragma once
 
 #include <QAbstractSocket>
+#include <QByteArray>
 #include <QElapsedTimer>
+#include <QJsonArray>
+#include <QJsonObject>
 #include <QJsonValue>
 #include <QObject>
 #include <QStringList>
@@ -107,6 +110,7 @@ private slots:
   void onConnected();
   void onDisconnected();
   void onTextMessageReceived(const QString &message);
+  void onBinaryMessageReceived(const QByteArray &message);
   void onErrorOccurred(QAbstractSocket::SocketError error);
   void tryReconnect();
 
@@ -114,7 +118,10 @@ private:
   void connectNow();
   void setLastError(const QString &err);
   void appendLog(const QString &line);
+  void finishRoundTrip(int payloadBytes);
+  void applyResponse(const QJsonObject &root, const QByteArray &viz);
   static QVariant jsonToVariant(const QJsonValue &v);
+  static QVariantList decodeF16(const QByteArray &viz, const QJsonObject &section);
 
   static constexpr int MAX_TOKENS_DISPLAY = 256;
   static constexpr int MAX_LOG_LINES = 500;
@@ -155,6 +162,11 @@ private:
   QStringList m_logLines;
   QString m_lastJson;
 
+  // "kind": "viz" header waiting for its binary frame.
+  QJsonObject m_pendingHeader;
+  bool m_hasPendingHeader = false;
+  int m_pendingHeaderBytes = 0;
+
   QElapsedTimer m_roundTripTimer;
   bool m_roundTripActive = false;
   double m_lastRoundTripMs = 0.0;